@@ -45,6 +45,8 @@ class DatabaseConfig(BaseModel):
     directory: str
     use_test_db: bool
     echo: bool
+    # 开启后 SQLite 使用 WAL 日志 + synchronous=NORMAL (读写并发更好, 断电时可能丢失最后一次提交)
+    wal_mode: bool = False
 
 
 
@@ -4,6 +4,7 @@
 本模块负责创建数据库引擎、初始化表结构,并提供数据库会话生成器;
 初始化时会填充最基础的字典数据;
 """
+from sqlalchemy import event
 from sqlmodel import SQLModel, create_engine, Session, select
 from app.core.config import settings
 from app.core.logger import logger
@@ -12,6 +13,23 @@ from app.core.logger import logger
 engine = create_engine(settings.SQLITE_URL, echo=settings.database.echo)
 
 
+def _set_sqlite_pragma(dbapi_connection, connection_record) -> None:
+    """
+    为每个新建的 SQLite 连接设置 PRAGMA (仅在 database.wal_mode 开启时注册);
+
+    WAL 模式下读写互不阻塞 (上传后台校验任务与列表查询并发),
+    synchronous=NORMAL 在 WAL 下只在检查点时 fsync, 单次提交不再刷盘两次;
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+if settings.database.wal_mode:
+    event.listen(engine, "connect", _set_sqlite_pragma)
+
+
 def init_db() -> None:
     """
     初始化数据库;
@@ -26,6 +44,11 @@ def init_db() -> None:
     from app.models.user import User, SharedLink
     from app.models.device_mapping import DeviceMapping
     SQLModel.metadata.create_all(engine)
+
+    # create_all 只会为新建的表建索引, 已存在的表需要补建后加的索引
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
     
     # 初始化最基础的字典数据
     _init_base_data()
@@ -118,8 +118,8 @@ def get_files(
                 ParseResult.status == status
             )
 
-    # 计算总数
-    total = len(session.exec(query).all())
+    # 计算总数 (在数据库侧 COUNT, 不把整张结果集实例化成 ORM 对象)
+    total = session.exec(select(func.count()).select_from(query.subquery())).one()
 
     # 排序处理
     sort_key = sort[1:] if sort.startswith("-") else sort
@@ -26,7 +26,12 @@ def get_by_file_id(session: Session, sensor_file_id: str) -> Optional[ParseResul
     ).first()
 
 
-def create_or_update(session: Session, sensor_file_id: str, data: dict) -> ParseResult:
+def create_or_update(
+    session: Session,
+    sensor_file_id: str,
+    data: dict,
+    existing: Optional[ParseResult] = None,
+) -> ParseResult:
     """
     创建或更新解析结果 (upsert);
     
@@ -36,11 +41,13 @@ def create_or_update(session: Session, sensor_file_id: str, data: dict) -> Parse
         session: 数据库会话;
         sensor_file_id: SensorFile ID;
         data: 要设置的字段;
+        existing: 调用方已在同一会话中查询到的记录, 传入时跳过重复查询;
         
     Returns:
         ParseResult: 解析结果;
     """
-    existing = get_by_file_id(session, sensor_file_id)
+    if existing is None:
+        existing = get_by_file_id(session, sensor_file_id)
     
     if existing:
         for k, v in data.items():
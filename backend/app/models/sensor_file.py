@@ -83,7 +83,7 @@ class SensorFile(SQLModel, table=True):
     test_type_l1: str = Field(default="Unknown", alias="testTypeL1")
     test_type_l2: str = Field(default="--", alias="testTypeL2")
     notes: str = Field(default="")
-    upload_time: str = Field(alias="uploadTime")
+    upload_time: str = Field(alias="uploadTime", index=True)
 
     # 新字段 (阶段 6b)
     tester: str = Field(default="")
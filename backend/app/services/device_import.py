@@ -101,7 +101,7 @@ class DownloadManager:
                 temp_dir = StorageService.get_raw_dir()
                 temp_path = temp_dir / f"temp_{uuid.uuid4()}.zst"
                 
-                md5 = hashlib.md5()
+                md5 = hashlib.md5(usedforsecurity=False)
                 frame_index = []  # 帧索引表
                 try:
                     # 1. 准备流式处理变量
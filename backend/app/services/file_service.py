@@ -31,8 +31,13 @@ class FileService:
         """
         logger.info(f"Starting background verification for file {file_id}")
         try:
+            # 上传时保存的帧索引 (前端按标准规则切帧时可免去重建)
+            with Session(engine) as session:
+                phy_file = crud.get_physical_file(session, md5)
+                existing_index = phy_file.frame_index if phy_file else None
+            
             # 验证文件完整性 并 按需重建索引
-            verify_res = StorageService.verify_and_rebuild_index(Path(path), md5)
+            verify_res = StorageService.verify_and_rebuild_index(Path(path), md5, existing_index)
             is_valid = verify_res["valid"]
             
             with Session(engine) as session:
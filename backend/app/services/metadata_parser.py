@@ -10,9 +10,13 @@ from typing import Dict, List, Optional, Any
 import zstandard as zstd
 from app.core.logger import logger
 
+# 预编译正则, 避免每次调用都查 re 模块缓存
+_CONTROL_CHARS = re.compile(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F]')
+_DATE_PREFIX = re.compile(r'^\d{4}-\d{2}-\d{2}')
+
 def clean_control_characters(text: str) -> str:
     """Remove problematic ASCII control characters while keeping \t, \n, \r."""
-    return re.sub(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F]', '', text)
+    return _CONTROL_CHARS.sub('', text)
 
 
 def repair_json_via_comma_split(json_content: str) -> str:
@@ -114,7 +118,6 @@ def extract_metadata_from_content(content: str, return_merged: bool = True) -> A
         dict | list: 元数据字典或列表;
     """
     metadata_objects = []
-    date_pattern = re.compile(r'^\d{4}-\d{2}-\d{2}')
     buffer, brace_count = '', 0
     
     lines = content.splitlines()
@@ -123,7 +126,7 @@ def extract_metadata_from_content(content: str, return_merged: bool = True) -> A
         stripped = line.strip()
 
         # 停止条件: 遇到 "start collecting" 或 日期开头的长行 (表示数据区开始)
-        if 'start collecting' in stripped or (len(stripped) > 10 and date_pattern.match(stripped)):
+        if 'start collecting' in stripped or (len(stripped) > 10 and _DATE_PREFIX.match(stripped)):
             break
 
         if not buffer and not stripped.startswith('{'):
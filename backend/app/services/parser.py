@@ -10,10 +10,9 @@
 """
 import io
 import json
-import os
 import time
 import traceback
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 from os import cpu_count
 from pathlib import Path
@@ -21,6 +20,8 @@ from typing import Dict, Any, Optional, List, Callable
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import zstandard as zstd
 
 from app.services.parser_types import (
@@ -30,6 +31,7 @@ from app.services.parser_types import (
     DATA_TYPE_MAPPING_RING,
     DATA_TYPE_CHINESE_RING,
     DF_KEY_TO_FILENAME,
+    HEX_INT,
     BatchMeta,
     FrameMeta,
     WorkerInput,
@@ -37,6 +39,7 @@ from app.services.parser_types import (
 )
 from app.services.parse_progress import parse_progress, map_parallel_progress
 from app.services.parser_worker import ParserWorker
+from app.services.parser_v2 import MANIFEST_SCHEMA_VERSION, strip_parse_generated_meta
 from app.services.storage import StorageService
 from app.core.logger import logger
 from app.core.database import engine
@@ -51,6 +54,12 @@ from sqlmodel import Session
 
 MIN_BATCH_FRAMES = 10
 MAX_PROCESS_WORKERS = 8
+MAX_PARQUET_WRITERS = 8
+
+# Parquet 写入参数: zstd level 3 速度接近 snappy 且压缩率更高; 大 row group 利于列式扫描
+PARQUET_ZSTD_LEVEL = 3
+PARQUET_ROW_GROUP_SIZE = 1_000_000
+PARQUET_DATA_PAGE_SIZE = 1 << 20
 
 
 def _normalize_frames(frames: list[dict]) -> list[FrameMeta]:
@@ -66,33 +75,43 @@ def _normalize_frames(frames: list[dict]) -> list[FrameMeta]:
 
 
 def _build_batches(frames: list[FrameMeta], min_batch_frames: int = MIN_BATCH_FRAMES) -> list[BatchMeta]:
-    batches: list[BatchMeta] = []
-    pending_frames: list[FrameMeta] = []
-    pending_start_idx = 0
-
-    for idx, frame in enumerate(frames):
-        if not pending_frames:
-            pending_start_idx = idx
-        pending_frames.append(frame)
-
-        if len(pending_frames) >= min_batch_frames and frame["nl"]:
-            batches.append({
-                "batch_id": len(batches),
-                "start_frame_idx": pending_start_idx,
-                "end_frame_idx": idx,
-                "compressed_bytes": sum(item["cl"] for item in pending_frames),
-                "frames": list(pending_frames),
-            })
-            pending_frames = []
+    """
+    按帧切分 batch: 每个 batch 至少 min_batch_frames 帧, 且必须在行对齐 (nl) 的帧处结束;
+
+    切分点通过 NumPy 在 nl 帧下标上 searchsorted 求得, 循环次数为 batch 数而非帧数;
+    compressed_bytes 由 cl 的前缀和相减得到;
+
+    Args:
+        frames: 规范化后的帧列表;
+        min_batch_frames: 每个 batch 的最少帧数;
+
+    Returns:
+        list[BatchMeta]: batch 列表;
+    """
+    n_frames = len(frames)
+    if n_frames == 0:
+        return []
 
-    if pending_frames:
+    cl = np.fromiter((frame["cl"] for frame in frames), dtype=np.int64, count=n_frames)
+    nl = np.fromiter((frame["nl"] for frame in frames), dtype=bool, count=n_frames)
+    cl_cum = np.concatenate(([0], np.cumsum(cl)))
+    nl_idx = np.flatnonzero(nl)
+    min_batch_frames = max(1, min_batch_frames)
+
+    batches: list[BatchMeta] = []
+    start = 0
+    while start < n_frames:
+        # 第一个满足最少帧数的行对齐帧即为本 batch 的结束帧; 找不到则剩余帧归为最后一个 batch
+        pos = int(np.searchsorted(nl_idx, start + min_batch_frames - 1))
+        end = int(nl_idx[pos]) if pos < len(nl_idx) else n_frames - 1
         batches.append({
             "batch_id": len(batches),
-            "start_frame_idx": pending_start_idx,
-            "end_frame_idx": len(frames) - 1,
-            "compressed_bytes": sum(item["cl"] for item in pending_frames),
-            "frames": list(pending_frames),
+            "start_frame_idx": start,
+            "end_frame_idx": end,
+            "compressed_bytes": int(cl_cum[end + 1] - cl_cum[start]),
+            "frames": frames[start:end + 1],
         })
+        start = end + 1
 
     return batches
 
@@ -117,9 +136,10 @@ def _worker_parse_batch(worker_input: WorkerInput) -> WorkerOutput:
             is_ring=is_ring,
             merge_consecutive=False,
         )
+        # 回传主进程前去掉空的通道列表, 减少 pickle 载荷; merge_partial_results 对缺失 key 按空列表处理
         return {
             "batch_id": batch["batch_id"],
-            "result": parsed,
+            "result": {key: value for key, value in parsed.items() if key == "data_types" or value},
         }
     except Exception as exc:
         raise RuntimeError(
@@ -201,7 +221,7 @@ class ParserDispatcher:
         completed_batches = 0
 
         with ProcessPoolExecutor(max_workers=worker_count) as executor:
-            futures = {
+            batch_of: dict[Future, int] = {
                 executor.submit(
                     _worker_parse_batch,
                     {
@@ -212,15 +232,19 @@ class ParserDispatcher:
                 ): batch["batch_id"]
                 for batch in batches
             }
+            pending: set[Future] = set(batch_of)
 
-            for future in as_completed(futures):
-                batch_id = futures[future]
+            for future in as_completed(batch_of):
+                pending.discard(future)
+                batch_id = batch_of[future]
                 try:
                     worker_output = future.result()
                 except Exception as exc:
-                    for pending in futures:
-                        pending.cancel()
-                    logger.error(f"[parallel] batch {batch_id} failed, terminate parse")
+                    # 一次性取消所有未开始的 batch, 不再逐个遍历 future
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    logger.error(
+                        f"[parallel] batch {batch_id} failed, terminate parse ({len(pending)} batches dropped)"
+                    )
                     raise RuntimeError(f"parallel parse failed at batch {batch_id}") from exc
 
                 ordered_results[worker_output["batch_id"]] = worker_output["result"]
@@ -275,17 +299,6 @@ class ParserService:
     负责解析原始传感器数据文件并生成处理后的 Parquet 数据文件;
     """
 
-    @staticmethod
-    def _strip_parse_generated_meta(content_meta: Optional[dict]) -> dict:
-        """移除解析过程写入的派生字段, 仅保留业务元数据。"""
-        if not isinstance(content_meta, dict):
-            return {}
-
-        cleaned = dict(content_meta)
-        for key in ("manifest", "parse_summary", "duration_seconds", "raw_file_size"):
-            cleaned.pop(key, None)
-        return cleaned
-
     @staticmethod
     def _create_progress_cb(file_id: str) -> Callable[[int], None]:
         _last_reported = [0]
@@ -329,7 +342,7 @@ class ParserService:
                 if sf:
                     filename = sf.filename
                 if existing_pr and existing_pr.content_meta:
-                    content_meta = ParserService._strip_parse_generated_meta(existing_pr.content_meta)
+                    content_meta = strip_parse_generated_meta(existing_pr.content_meta)
 
                 if pf and pf.frame_index:
                     frame_index = pf.frame_index
@@ -366,7 +379,7 @@ class ParserService:
 
             # 更新 DB
             with Session(engine) as session:
-                merged_meta = ParserService._strip_parse_generated_meta(content_meta)
+                merged_meta = strip_parse_generated_meta(content_meta)
                 merged_meta["manifest"] = result.get("manifest", {})
                 merged_meta["parse_summary"] = result["parse_summary"]
                 manifest_obj = result.get("manifest", {})
@@ -471,8 +484,7 @@ class ParserService:
 
         # 3. 计算 duration
         base_info_df = parse_result.get("base_info_df")
-        duration = ParserService._calculate_duration(base_info_df)
-        duration_seconds = ParserService._calculate_duration_seconds(base_info_df)
+        duration, duration_seconds = ParserService._duration_pair(base_info_df)
         logger.info(f"[parse_file] Phase 3: duration={duration}")
 
         # 4. 格式化 packets (根据设备类型选择映射表)
@@ -517,7 +529,7 @@ class ParserService:
         """
         将解析结果中的 DataFrame 保存为 Parquet 文件;
 
-        所有 np.ndarray 列在保存前转为 Python list;
+        np.ndarray 列由 pyarrow 原生转换为 LIST 列;
 
         Args:
             result_dict: 解析结果字典 (含各 DataFrame);
@@ -529,61 +541,64 @@ class ParserService:
         output_dir.mkdir(parents=True, exist_ok=True)
         parse_summary = {"keys": {}, "summary": {"total_rows": 0, "size_kb": 0}}
 
+        pending: list[tuple[str, pd.DataFrame]] = []
         for df_key, pq_name in DF_KEY_TO_FILENAME.items():
             df = result_dict.get(df_key)
-            if df is None or (isinstance(df, pd.DataFrame) and df.empty):
-                continue
-
-            if not isinstance(df, pd.DataFrame):
+            if not isinstance(df, pd.DataFrame) or df.empty:
                 continue
+            pending.append((pq_name, df))
 
-            # 将所有残余的 ndarray 列转为 list
-            df = ParserService._convert_ndarray_columns(df)
+        if not pending:
+            return parse_summary
 
+        def _write_one(pq_name: str, df: pd.DataFrame) -> Optional[dict]:
             pq_filename = f"{pq_name}.parquet"
             pq_path = output_dir / pq_filename
 
             try:
-                df.to_parquet(pq_path, engine="pyarrow", compression="snappy", index=False)
-                file_size_kb = round(os.path.getsize(pq_path) / 1024, 1)
-
-                parse_summary["keys"][pq_name] = {
+                # ndarray 列由 Arrow 在 C 层直接转为 LIST 类型, 无需逐行 tolist()
+                table = pa.Table.from_pandas(df, preserve_index=False, nthreads=cpu_count())
+                # 写入位置即文件大小, 省去写完后的 stat()
+                with pa.OSFile(str(pq_path), "wb") as sink:
+                    pq.write_table(
+                        table,
+                        sink,
+                        compression="zstd",
+                        compression_level=PARQUET_ZSTD_LEVEL,
+                        use_dictionary=True,
+                        row_group_size=PARQUET_ROW_GROUP_SIZE,
+                        data_page_size=PARQUET_DATA_PAGE_SIZE,
+                    )
+                    file_size_kb = round(sink.tell() / 1024, 1)
+                logger.info(f"Saved {pq_filename}: {len(df)} rows, {file_size_kb} KB")
+                return {
                     "rows": len(df),
                     "columns": list(df.columns),
                     "file": pq_filename,
                     "size_kb": file_size_kb,
                 }
-                parse_summary["summary"]["total_rows"] += len(df)
-                parse_summary["summary"]["size_kb"] += file_size_kb
-
-                logger.info(f"Saved {pq_filename}: {len(df)} rows, {file_size_kb} KB")
             except Exception as e:
                 logger.error(f"Failed to save {pq_filename}: {e}\n{traceback.format_exc()}")
+                return None
 
-        parse_summary["summary"]["size_kb"] = round(parse_summary["summary"]["size_kb"], 1)
-        return parse_summary
-
-    @staticmethod
-    def _convert_ndarray_columns(df: pd.DataFrame) -> pd.DataFrame:
-        """
-        将 DataFrame 中所有 np.ndarray 类型的值转为 Python list;
+        # pyarrow 编码/压缩在 C 层释放 GIL, 各数据类型的写入可并行
+        written: dict[str, Optional[dict]] = {}
+        with ThreadPoolExecutor(max_workers=min(MAX_PARQUET_WRITERS, len(pending))) as executor:
+            futures = {executor.submit(_write_one, pq_name, df): pq_name for pq_name, df in pending}
+            for future in as_completed(futures):
+                written[futures[future]] = future.result()
 
-        Args:
-            df: 待转换的 DataFrame;
+        # 按注册表顺序汇总, 保证 manifest 中 keys 顺序稳定
+        for pq_name, _ in pending:
+            entry = written.get(pq_name)
+            if entry is None:
+                continue
+            parse_summary["keys"][pq_name] = entry
+            parse_summary["summary"]["total_rows"] += entry["rows"]
+            parse_summary["summary"]["size_kb"] += entry["size_kb"]
 
-        Returns:
-            pd.DataFrame: 转换后的 DataFrame;
-        """
-        df = df.copy()
-        for col in df.columns:
-            # 检查该列是否包含 ndarray
-            sample = df[col].dropna().head(5)
-            has_ndarray = any(isinstance(v, np.ndarray) for v in sample)
-            if has_ndarray:
-                df[col] = df[col].apply(
-                    lambda x: x.tolist() if isinstance(x, np.ndarray) else x
-                )
-        return df
+        parse_summary["summary"]["size_kb"] = round(parse_summary["summary"]["size_kb"], 1)
+        return parse_summary
 
     @staticmethod
     def _write_manifest(
@@ -622,7 +637,11 @@ class ParserService:
         Returns:
             dict: manifest 内容;
         """
+        # 剔除已在 parse_summary 中体现的派生字段
+        compact_meta = strip_parse_generated_meta(content_meta)
+
         manifest = {
+            "schema_version": MANIFEST_SCHEMA_VERSION,
             "file_hash": file_hash,
             "sensor_file_id": sensor_file_id,
             "filename": filename,
@@ -639,7 +658,7 @@ class ParserService:
             "summary": parse_summary.get("summary", {}),
             "data_types": data_types,
             "labels": labels,
-            "content_meta": content_meta or {},
+            "content_meta": compact_meta,
         }
 
         manifest_path = output_dir / "manifest.json"
@@ -650,40 +669,54 @@ class ParserService:
         return manifest
 
     @staticmethod
-    def _calculate_duration(base_info_df) -> str:
+    def _duration_pair(base_info_df) -> tuple[str, Optional[int]]:
         """
-        从 base_info_df 的首末 unix_timestamp 计算时长;
+        从 base_info_df 的首末 unix_timestamp 同时计算时长字符串与秒数;
+
+        unix_timestamp 列只做一次 min/max 扫描;
 
         Args:
             base_info_df: 基础信息 DataFrame;
 
         Returns:
-            str: 格式化的时长字符串, 如 "3h 42m" 或 "--";
+            tuple: (格式化时长如 "3h 42m" 或 "--", 时长秒数或 None);
         """
         if base_info_df is None or not isinstance(base_info_df, pd.DataFrame):
-            return "--"
+            return "--", None
         if base_info_df.empty or "unix_timestamp" not in base_info_df.columns:
-            return "--"
+            return "--", None
 
         try:
-            ts_min = base_info_df["unix_timestamp"].min()
-            ts_max = base_info_df["unix_timestamp"].max()
-            diff_sec = int(ts_max - ts_min)
-
-            if diff_sec < 0:
-                return "--"
-            if diff_sec < 60:
-                return f"{diff_sec}s"
-
-            hours = diff_sec // 3600
-            minutes = (diff_sec % 3600) // 60
-            seconds = diff_sec % 60
-
-            if hours > 0:
-                return f"{hours}h {minutes}m"
-            return f"{minutes}m {seconds}s"
+            ts = base_info_df["unix_timestamp"]
+            diff_sec = int(ts.max() - ts.min())
         except Exception:
-            return "--"
+            return "--", None
+
+        if diff_sec < 0:
+            return "--", None
+        if diff_sec < 60:
+            return f"{diff_sec}s", diff_sec
+
+        hours = diff_sec // 3600
+        minutes = (diff_sec % 3600) // 60
+        seconds = diff_sec % 60
+
+        if hours > 0:
+            return f"{hours}h {minutes}m", diff_sec
+        return f"{minutes}m {seconds}s", diff_sec
+
+    @staticmethod
+    def _calculate_duration(base_info_df) -> str:
+        """
+        从 base_info_df 的首末 unix_timestamp 计算时长;
+
+        Args:
+            base_info_df: 基础信息 DataFrame;
+
+        Returns:
+            str: 格式化的时长字符串, 如 "3h 42m" 或 "--";
+        """
+        return ParserService._duration_pair(base_info_df)[0]
 
     @staticmethod
     def _calculate_duration_seconds(base_info_df) -> Optional[int]:
@@ -696,20 +729,7 @@ class ParserService:
         Returns:
             Optional[int]: 时长秒数, 无法计算时返回 None;
         """
-        if base_info_df is None or not isinstance(base_info_df, pd.DataFrame):
-            return None
-        if base_info_df.empty or "unix_timestamp" not in base_info_df.columns:
-            return None
-
-        try:
-            ts_min = base_info_df["unix_timestamp"].min()
-            ts_max = base_info_df["unix_timestamp"].max()
-            diff_sec = int(ts_max - ts_min)
-            if diff_sec < 0:
-                return None
-            return diff_sec
-        except Exception:
-            return None
+        return ParserService._duration_pair(base_info_df)[1]
 
     @staticmethod
     def _format_packets(data_type_dict: dict, is_ring: bool = False) -> list:
@@ -726,8 +746,11 @@ class ParserService:
         type_map = DATA_TYPE_MAPPING_RING if is_ring else DATA_TYPE_MAPPING
         cn_map = DATA_TYPE_CHINESE_RING if is_ring else DATA_TYPE_CHINESE
         packets = []
-        sorted_types = sorted(data_type_dict.keys(), key=lambda x: int(x, 16))
-        for dt in sorted_types:
+        sorted_items = sorted(
+            data_type_dict.items(),
+            key=lambda kv: HEX_INT[kv[0]] if kv[0] in HEX_INT else int(kv[0], 16),
+        )
+        for dt, count in sorted_items:
             dt_enum = DataType.from_hex(dt)
             type_name = type_map.get(dt_enum) if dt_enum else None
             type_name_cn = cn_map.get(dt_enum) if dt_enum else None
@@ -735,6 +758,6 @@ class ParserService:
                 "type": dt,
                 "name": type_name or f"UNKNOWN({dt})",
                 "name_cn": type_name_cn or f"Unknown({dt})",
-                "count": data_type_dict[dt],
+                "count": count,
             })
         return packets
@@ -9,10 +9,13 @@
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import sys
+from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any, Optional, TypedDict
 
+from app.services import data_structures as _ds
+
 
 class FrameMeta(TypedDict):
     cs: int
@@ -92,11 +95,14 @@ class DataType(str, Enum):
     def from_hex(cls, value: str) -> Optional["DataType"]:
         if not isinstance(value, str):
             return None
-        normalized = value.upper()
-        try:
-            return cls(normalized)
-        except ValueError:
-            return None
+        return _HEX_TO_DATATYPE.get(value.upper())
+
+
+# hex 字符串 -> DataType, 避免 from_hex 每次走 Enum 构造 + try/except
+_HEX_TO_DATATYPE: dict[str, DataType] = {dt.value: dt for dt in DataType}
+
+# hex 字符串 -> 整数值, 供排序使用, 避免反复 int(x, 16)
+HEX_INT: dict[str, int] = {dt.value: int(dt.value, 16) for dt in DataType}
 
 
 DATA_TYPE_MAPPING = {
@@ -219,7 +225,15 @@ class MergeStrategy(str, Enum):
     CONSECUTIVE_PPG = "consecutive_ppg"    # PPG 类: 按 serial_number 合并 ppg_data
 
 
-@dataclass(frozen=True)
+# 合并策略 -> 需要拼接的数据字段 (None 表示不合并)
+_MERGE_FIELD: dict[MergeStrategy, Optional[str]] = {
+    MergeStrategy.NONE: None,
+    MergeStrategy.CONSECUTIVE_ACC: "acc_data",
+    MergeStrategy.CONSECUTIVE_PPG: "ppg_data",
+}
+
+
+@dataclass(frozen=True, slots=True)
 class SensorChannel:
     """描述一个传感器数据通道的完整流水线配置。"""
 
@@ -248,6 +262,17 @@ class SensorChannel:
     ring_variant: bool = False          # True => 仅在 is_ring 时解析
     watch_variant: bool = False         # True => 仅在非 is_ring 时解析
 
+    # --- 派生字段 (构造时推导, 热路径直接读取) ---
+    merge_field: Optional[str] = field(default=None, init=False)   # 由 merge_strategy 推导, 无需比较枚举
+    parser_cls: Optional[type] = field(default=None, init=False)   # 由 parser_class_name 解析出的解析器类
+
+    def __post_init__(self) -> None:
+        # 驻留用作 dict key 的字符串字段, 查找时可走指针相等的快速路径
+        for name in ("list_key", "parser_class_name", "df_key", "parquet_name"):
+            object.__setattr__(self, name, sys.intern(getattr(self, name)))
+        object.__setattr__(self, "merge_field", _MERGE_FIELD[self.merge_strategy])
+        object.__setattr__(self, "parser_cls", getattr(_ds, self.parser_class_name))
+
 
 # ---------------------------------------------------------------------------
 # 全局注册表
@@ -392,17 +417,32 @@ SENSOR_CHANNELS: list[SensorChannel] = [
 # ---------------------------------------------------------------------------
 
 def _build_lookup() -> dict[str, Any]:
-    """构建各种方便查询的索引。"""
+    """构建各种方便查询的索引 (单次遍历注册表)。"""
     by_type: dict[DataType, list[SensorChannel]] = {}
+    by_key: dict[str, SensorChannel] = {}
+    df_to_pq: dict[str, str] = {}
+    all_list_keys: list[str] = []
+    # is_ring -> 下标为 DataType 整数值的单通道分派表 (已按 ring/watch variant 过滤)
+    table_size = max(HEX_INT.values()) + 1
+    dispatch: dict[bool, list[Optional[SensorChannel]]] = {
+        False: [None] * table_size,
+        True: [None] * table_size,
+    }
+
     for ch in SENSOR_CHANNELS:
+        code = HEX_INT[ch.data_type.value]
         by_type.setdefault(ch.data_type, []).append(ch)
-
-    by_key: dict[str, SensorChannel] = {ch.list_key: ch for ch in SENSOR_CHANNELS}
-    df_to_pq: dict[str, str] = {ch.df_key: ch.parquet_name for ch in SENSOR_CHANNELS}
-    all_list_keys: list[str] = [ch.list_key for ch in SENSOR_CHANNELS]
+        if not ch.ring_variant:
+            dispatch[False][code] = ch
+        if not ch.watch_variant:
+            dispatch[True][code] = ch
+        by_key[ch.list_key] = ch
+        df_to_pq[ch.df_key] = ch.parquet_name
+        all_list_keys.append(ch.list_key)
 
     return {
         "by_type": by_type,
+        "dispatch": {is_ring: tuple(table) for is_ring, table in dispatch.items()},
         "by_key": by_key,
         "df_to_pq": df_to_pq,
         "all_list_keys": all_list_keys,
@@ -412,6 +452,7 @@ def _build_lookup() -> dict[str, Any]:
 _LOOKUP = _build_lookup()
 
 CHANNEL_BY_TYPE: dict[DataType, list[SensorChannel]] = _LOOKUP["by_type"]
+CHANNEL_DISPATCH: dict[bool, tuple[Optional[SensorChannel], ...]] = _LOOKUP["dispatch"]
 CHANNEL_BY_KEY: dict[str, SensorChannel] = _LOOKUP["by_key"]
 DF_KEY_TO_FILENAME: dict[str, str] = _LOOKUP["df_to_pq"]
 ALL_LIST_KEYS: list[str] = _LOOKUP["all_list_keys"]
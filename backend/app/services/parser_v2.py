@@ -10,9 +10,8 @@ Parser V2: 极简解析实现。
 """
 
 import json
+import os
 import time
-import traceback
-from datetime import datetime
 from pathlib import Path
 from typing import Any, Callable, Dict, Optional
 
@@ -25,6 +24,66 @@ from app.models.sensor_file import SensorFile
 from app.services.parse_progress import parse_progress
 from app.services.storage import StorageService
 
+# manifest.json 结构版本：2 起 content_meta 不含解析派生字段。
+MANIFEST_SCHEMA_VERSION = 2
+
+# 解析流程写入 content_meta 的派生字段（parser 与 parser_v2 共用）。
+PARSE_GENERATED_META_KEYS = frozenset({"manifest", "parse_summary", "duration_seconds", "raw_file_size"})
+
+
+def strip_parse_generated_meta(content_meta: Optional[dict]) -> dict:
+    """
+    清理 content_meta 中由解析流程生成的派生字段。
+
+    作用：
+    - 避免一次解析的派生产物污染下一次解析输入；
+    - 保留业务侧原始元数据（例如上传时识别出的业务字段）；
+    - manifest 中的 content_meta 不再重复 parse_summary 已有的内容。
+
+    Args:
+        content_meta: 旧的解析元数据快照。
+
+    Returns:
+        dict: 去除派生字段后的“干净”元数据。
+    """
+    if not isinstance(content_meta, dict):
+        return {}
+    return {k: v for k, v in content_meta.items() if k not in PARSE_GENERATED_META_KEYS}
+
+
+class _ProgressCb:
+    """
+    单调递增的进度回调（SSE 推送）。
+
+    用 __slots__ 保存状态，替代闭包 + list 单元格，每次回调只做属性读写。
+    距上次推送不足 MIN_INTERVAL 秒的小幅增长会被丢弃，
+    跳变达到 MIN_STEP 或到达 100 时始终推送。
+    """
+
+    __slots__ = ("last", "file_id", "last_ts")
+
+    MIN_INTERVAL = 0.05
+    MIN_STEP = 5
+
+    def __init__(self, file_id: str):
+        self.last = 0
+        self.file_id = file_id
+        self.last_ts = 0.0
+
+    def __call__(self, progress: int) -> None:
+        if progress <= self.last:
+            return
+        now = time.monotonic()
+        if (
+            progress < 100
+            and progress - self.last < self.MIN_STEP
+            and now - self.last_ts < self.MIN_INTERVAL
+        ):
+            return
+        self.last = progress
+        self.last_ts = now
+        parse_progress.update(self.file_id, progress, "processing")
+
 
 class ParserServiceV2:
     """
@@ -36,29 +95,6 @@ class ParserServiceV2:
     3) 移除复杂内部解析细节，后续按需渐进填充。
     """
 
-    @staticmethod
-    def _strip_parse_generated_meta(content_meta: Optional[dict]) -> dict:
-        """
-        清理 content_meta 中由解析流程生成的派生字段。
-
-        作用：
-        - 避免一次解析的派生产物污染下一次解析输入；
-        - 保留业务侧原始元数据（例如上传时识别出的业务字段）；
-        - 在任务完成时再合并新的 manifest/summary。
-
-        Args:
-            content_meta: 旧的解析元数据快照。
-
-        Returns:
-            dict: 去除派生字段后的“干净”元数据。
-        """
-        if not isinstance(content_meta, dict):
-            return {}
-        cleaned = dict(content_meta)
-        for key in ("manifest", "parse_summary", "duration_seconds", "raw_file_size"):
-            cleaned.pop(key, None)
-        return cleaned
-
     @staticmethod
     def _create_progress_cb(file_id: str) -> Callable[[int], None]:
         """
@@ -67,6 +103,7 @@ class ParserServiceV2:
         约束：
         - 仅允许进度单调递增；
         - 避免重复推送同一进度值，减少前端无效刷新；
+        - 短时间内的小幅增长会被合并（节流），大跳变与 100 不受影响；
         - 状态固定为 processing，终态由任务入口统一上报。
 
         Args:
@@ -75,15 +112,7 @@ class ParserServiceV2:
         Returns:
             Callable[[int], None]: 可直接传入核心解析函数的回调。
         """
-        last = [0]
-
-        def progress_cb(progress: int):
-            if progress <= last[0]:
-                return
-            last[0] = progress
-            parse_progress.update(file_id, progress, "processing")
-
-        return progress_cb
+        return _ProgressCb(file_id)
 
     @staticmethod
     def parse_file_task(file_id: str, file_hash: str, device_type: str = "Watch"):
@@ -119,16 +148,17 @@ class ParserServiceV2:
                 if sf:
                     filename = sf.filename
                 if pr and pr.content_meta:
-                    content_meta = ParserServiceV2._strip_parse_generated_meta(pr.content_meta)
+                    content_meta = strip_parse_generated_meta(pr.content_meta)
 
                 # 关键点：processing 状态写库在任务内部完成。
                 # 这样外部 API 只负责触发任务，保持外部调用整洁。
+                # 复用上面查到的 pr，读与写在同一会话内一次提交，不再重复查询。
                 parse_result_crud.create_or_update(session, file_id, {
                     "status": "processing",
                     "device_type_used": device_type,
                     "progress": None,
                     "error_message": None,
-                })
+                }, existing=pr)
 
             # SSE 首帧：告知前端已进入 processing。
             parse_progress.update(file_id, 0, "processing")
@@ -149,13 +179,18 @@ class ParserServiceV2:
 
             with Session(engine) as session:
                 # 合并旧业务元数据与新解析派生字段。
-                merged_meta = ParserServiceV2._strip_parse_generated_meta(content_meta)
-                merged_meta["manifest"] = result.get("manifest", {})
-                merged_meta["parse_summary"] = result.get("parse_summary", {})
+                # content_meta 在任务开始时已清理过派生字段，这里只需浅拷贝，无历史元数据时直接用空 dict。
+                merged_meta = dict(content_meta) if content_meta else {}
                 manifest_obj = result.get("manifest", {})
+                merged_meta.update({
+                    "manifest": manifest_obj,
+                    "parse_summary": result.get("parse_summary", {}),
+                })
                 if isinstance(manifest_obj, dict):
-                    merged_meta["duration_seconds"] = manifest_obj.get("duration_seconds")
-                    merged_meta["raw_file_size"] = manifest_obj.get("raw_file_size")
+                    merged_meta.update({
+                        "duration_seconds": manifest_obj.get("duration_seconds"),
+                        "raw_file_size": manifest_obj.get("raw_file_size"),
+                    })
 
                 # 持久化终态 processed。
                 parse_result_crud.create_or_update(session, file_id, {
@@ -174,6 +209,9 @@ class ParserServiceV2:
             logger.info(f"[parser_v2] COMPLETED for {file_id} in {elapsed}s")
 
         except Exception as exc:
+            # 仅在失败分支才需要 traceback，延迟导入以减轻模块加载。
+            import traceback
+
             # 任意异常统一写回 error，避免前端卡在 processing。
             logger.error(f"[parser_v2] Parse failed for {file_id}: {exc}\n{traceback.format_exc()}")
             with Session(engine) as session:
@@ -225,14 +263,17 @@ class ParserServiceV2:
         output_dir = StorageService.get_processed_dir(file_hash)
 
         # 先做硬性校验，避免后续写入“伪成功”结果。
-        if not raw_path.exists():
-            raise FileNotFoundError(f"Raw file not found: {raw_path}")
+        # 只 stat 一次，同时得到存在性与文件大小。
+        try:
+            raw_stat = os.stat(raw_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Raw file not found: {raw_path}") from None
 
         if progress_cb:
             progress_cb(10)
 
         # 优先采用外部传入的压缩大小（通常来自 DB），缺失时回退到文件 stat。
-        file_size = compressed_size if (compressed_size is not None and compressed_size > 0) else raw_path.stat().st_size
+        file_size = compressed_size if (compressed_size is not None and compressed_size > 0) else raw_stat.st_size
 
         # 空实现结果：不生成 parquet，只提供结构化空摘要。
         parse_summary = {
@@ -326,7 +367,10 @@ class ParserServiceV2:
         Returns:
             dict: manifest 内容（同时已写盘）。
         """
+        from datetime import datetime
+
         manifest = {
+            "schema_version": MANIFEST_SCHEMA_VERSION,
             "file_hash": file_hash,
             "sensor_file_id": sensor_file_id,
             "filename": filename,
@@ -343,14 +387,15 @@ class ParserServiceV2:
             "summary": parse_summary.get("summary", {}),
             "data_types": data_types,
             "labels": labels,
-            "content_meta": content_meta or {},
+            "content_meta": strip_parse_generated_meta(content_meta),
         }
 
-        # 确保输出目录存在后再写入清单文件。
-        output_dir.mkdir(parents=True, exist_ok=True)
+        # 先编码为 UTF-8 bytes，绕过 TextIOWrapper 的二次编码与缓冲。
+        payload = json.dumps(manifest, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+
+        # output_dir 由 StorageService.get_processed_dir 创建，这里直接写入。
         manifest_path = output_dir / "manifest.json"
-        with open(manifest_path, "w", encoding="utf-8") as file_obj:
-            json.dump(manifest, file_obj, ensure_ascii=False, indent=2, default=str)
+        manifest_path.write_bytes(payload)
 
         logger.info(f"[parser_v2] Manifest written to {manifest_path}")
         return manifest
@@ -8,23 +8,27 @@
 """
 
 import json
+import re
 import time
-from typing import Any, Dict, Iterable, List, cast
+from itertools import islice
+from operator import attrgetter
+from typing import Any, Dict, Iterable, cast
 
 import numpy as np
 import pandas as pd
 
 from app.core.logger import logger
-from app.services import data_structures as _ds
 from app.services.parser_types import (
     DataType,
     SENSOR_CHANNELS,
-    CHANNEL_BY_TYPE,
+    CHANNEL_DISPATCH,
+    HEX_INT,
     ALL_LIST_KEYS,
-    MergeStrategy,
-    SensorChannel,
 )
 
+# 原始数据行字段分隔符 ("," 或 ", ")
+_FIELD_SEP = re.compile(r", ?")
+
 
 class ParserWorker:
     """解析执行器。"""
@@ -48,30 +52,30 @@ class ParserWorker:
         if max_channel <= 0:
             return ppg_df
 
+        # 空占位使用 int64, 写 parquet 时 Arrow 推断为与 PPG 数据一致的 LIST<int64>,
+        # 与旧版先 tolist() 再写出的类型相同; 若用 float64 占位, 整列会变成 LIST<double>,
+        # /data 接口读出的数值会变为 1.0 形式。仅全空的占位列由 LIST<null> 变为 LIST<int64>, 读出仍为 []
+        empty_arr = np.array([], dtype=np.int64)
+        n_rows = len(ppg_df)
         if (ppg_df["channel_num"] == 1).all():
-            ppg_df["ppg_data_0"] = ppg_df["ppg_data"]
+            new_cols = {"ppg_data_0": ppg_df["ppg_data"]}
+            empty_col = [empty_arr] * n_rows
             for ch in range(1, max_channel):
-                ppg_df[f"ppg_data_{ch}"] = [np.array([])] * len(ppg_df)
+                new_cols[f"ppg_data_{ch}"] = empty_col
         else:
-            empty_arr = np.array([])
-            for ch in range(max_channel):
-                ppg_df[f"ppg_data_{ch}"] = [empty_arr] * len(ppg_df)
-
-            mask_1 = ppg_df["channel_num"] == 1
-            if mask_1.any():
-                ppg_df.loc[mask_1, "ppg_data_0"] = ppg_df.loc[mask_1, "ppg_data"]
-
-            for ch_val in range(2, max_channel + 1):
-                mask = ppg_df["channel_num"] == ch_val
-                if not mask.any():
-                    continue
-                indices = ppg_df.index[mask]
-                for idx in indices:
-                    ppg_data = ppg_df.at[idx, "ppg_data"]
-                    if not isinstance(ppg_data, np.ndarray) or len(ppg_data) == 0:
-                        continue
+            # 先在 Python 列表中按行填充各通道, 最后整列写回, 避免逐格 .at 赋值
+            ch_lists = [[empty_arr] * n_rows for _ in range(max_channel)]
+            channel_vals = ppg_df["channel_num"].tolist()
+            ppg_values = ppg_df["ppg_data"].tolist()
+            for i, (ch_val, ppg_data) in enumerate(zip(channel_vals, ppg_values)):
+                if ch_val == 1:
+                    ch_lists[0][i] = ppg_data
+                elif ch_val >= 2 and isinstance(ppg_data, np.ndarray) and len(ppg_data) > 0:
                     for ch in range(min(ch_val, max_channel)):
-                        ppg_df.at[idx, f"ppg_data_{ch}"] = ppg_data[ch::ch_val]
+                        ch_lists[ch][i] = ppg_data[ch::ch_val]
+            new_cols = {f"ppg_data_{ch}": col for ch, col in enumerate(ch_lists)}
+
+        ppg_df = ppg_df.assign(**new_cols)
 
         return ppg_df
 
@@ -94,23 +98,9 @@ class ParserWorker:
         data_type_dict: Dict[str, int] = {}
         last_unix_timestamp = 0
 
-        # 构建 data_type -> 适用通道 的快速查找表 (考虑 ring/watch variant)
-        dispatch: dict[DataType, SensorChannel] = {}
-        for dt, channels in CHANNEL_BY_TYPE.items():
-            for ch in channels:
-                if ch.ring_variant and not is_ring:
-                    continue
-                if ch.watch_variant and is_ring:
-                    continue
-                dispatch[dt] = ch
-
-        # 解析器类缓存 (按 class_name -> class)
-        parser_cache: dict[str, type] = {}
-
-        def _get_parser(class_name: str):
-            if class_name not in parser_cache:
-                parser_cache[class_name] = getattr(_ds, class_name)
-            return parser_cache[class_name]
+        # data_type 整数值 -> 适用通道 的稠密查找表 (导入时已按 ring/watch variant 生成)
+        dispatch = CHANNEL_DISPATCH[bool(is_ring)]
+        type_cache: dict[str, tuple] = {}
 
         # 合并状态: list_key -> pending item
         pending: dict[str, Any] = {}
@@ -121,35 +111,41 @@ class ParserWorker:
                 continue
 
             if line.startswith("202"):
-                data = line.replace(", ", ",").split(",")
+                # 只切出前 10 个头字段, 负载保持为一个连续子串, 不再生成上百个小字符串;
+                # 分隔符 "," 与 ", " 混用, 由正则一次切分, 无需先整行 replace
+                data = _FIELD_SEP.split(line, 10)
                 if len(data) < 11 or data[3] != "52":
                     continue
 
+                payload = data[10]
                 data_type_raw = data[4]
                 try:
-                    unix_timestamp = int("".join(data[6:10]), 16)
+                    unix_timestamp = int(data[6] + data[7] + data[8] + data[9], 16)
                     label_hr = int(data[2], 16)
-                    data_bytes = bytes.fromhex("".join(data[10:]))
+                    # bytes.fromhex 忽略空白, 逗号换成空格即可整段解码
+                    data_bytes = bytes.fromhex(payload.replace(",", " "))
                 except (ValueError, IndexError):
                     continue
 
                 last_unix_timestamp = unix_timestamp
-                rawdata_v2 = len(data) == 243
+                rawdata_v2 = payload.count(",") == 232
                 parsed_timestamp = data[0]
 
-                data_type = data_type_raw.upper()
+                # 原始 hex 字符串 -> (规范化大写, 通道), 每种写法只 upper + 查表一次
+                entry = type_cache.get(data_type_raw)
+                if entry is None:
+                    data_type = data_type_raw.upper()
+                    code = HEX_INT.get(data_type)
+                    entry = (data_type, None if code is None else dispatch[code])
+                    type_cache[data_type_raw] = entry
+                data_type, channel = entry
                 data_type_dict[data_type] = data_type_dict.get(data_type, 0) + 1
-                data_type_enum = DataType.from_hex(data_type)
-
-                if data_type_enum is None:
-                    continue
 
-                channel = dispatch.get(data_type_enum)
                 if channel is None:
                     continue
 
                 # 构建 from_bytes 参数
-                parser_cls = _get_parser(channel.parser_class_name)
+                parser_cls = channel.parser_cls
                 kwargs: dict = {"timestamp": parsed_timestamp}
                 if channel.needs_unix_timestamp:
                     kwargs["unix_timestamp"] = unix_timestamp
@@ -165,15 +161,17 @@ class ParserWorker:
                 parsed_item = parser_cls.from_bytes(data_bytes, **kwargs)
 
                 # 合并或直接收集
-                if channel.merge_strategy == MergeStrategy.NONE:
+                data_field = channel.merge_field
+                if data_field is None:
                     collectors[channel.list_key].append(parsed_item)
                 else:
-                    data_field = "acc_data" if channel.merge_strategy == MergeStrategy.CONSECUTIVE_ACC else "ppg_data"
                     key = channel.list_key
                     prev = pending.get(key)
                     if merge_consecutive and prev is not None and prev.serial_number == parsed_item.serial_number:
-                        prev_data = getattr(prev, data_field)
-                        prev_data += getattr(parsed_item, data_field)
+                        if data_field == "acc_data":
+                            prev.acc_data += parsed_item.acc_data
+                        else:
+                            prev.ppg_data += parsed_item.ppg_data
                         prev.arr_size += parsed_item.arr_size
                     else:
                         if merge_consecutive and prev is not None:
@@ -221,15 +219,21 @@ class ParserWorker:
         """
         if not raw_items:
             return []
+        # 字段访问器只构建一次; 当前 pending 的数据列表缓存在局部变量中, 合并时不再重复取属性
+        get_data = attrgetter(data_field)
         merged: list = []
         pending = raw_items[0]
-        for item in raw_items[1:]:
-            if pending.serial_number == item.serial_number:
-                getattr(pending, data_field).extend(getattr(item, data_field))
+        pending_serial = pending.serial_number
+        pending_data = get_data(pending)
+        for item in islice(raw_items, 1, None):
+            if pending_serial == item.serial_number:
+                pending_data.extend(get_data(item))
                 pending.arr_size += item.arr_size
             else:
                 merged.append(pending)
                 pending = item
+                pending_serial = item.serial_number
+                pending_data = get_data(item)
         merged.append(pending)
         return merged
 
@@ -263,11 +267,10 @@ class ParserWorker:
 
         # 对需要合并的通道执行 serial_number 连续合并
         for ch in SENSOR_CHANNELS:
-            if ch.merge_strategy == MergeStrategy.NONE:
+            if ch.merge_field is None:
                 continue
-            data_field = "acc_data" if ch.merge_strategy == MergeStrategy.CONSECUTIVE_ACC else "ppg_data"
             merged[ch.list_key] = ParserWorker.merge_consecutive_items(
-                merged[ch.list_key], data_field
+                merged[ch.list_key], ch.merge_field
             )
 
         return merged
@@ -298,7 +301,14 @@ class ParserWorker:
 
         def _to_df(items: list, label: str = "") -> pd.DataFrame:
             t = time.time()
-            df = pd.DataFrame.from_records([vars(o) for o in items])
+            records = [vars(o) for o in items]
+            fields = list(records[0])
+            n_fields = len(fields)
+            if all(len(r) == n_fields for r in records):
+                # 按列组装 (SoA) 后一次性构建, 省去 from_records 的逐行处理
+                df = pd.DataFrame({f: [r[f] for r in records] for f in fields})
+            else:
+                df = pd.DataFrame.from_records(records)
             elapsed = time.time() - t
             if elapsed > 0.05:
                 logger.info(f"[build_dataframes] {label}: {len(items)} rows in {elapsed:.2f}s")
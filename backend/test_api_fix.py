@@ -3,22 +3,25 @@ import json
 
 BASE_URL = "http://localhost:8000/api/v1"
 
+# Reuse one Session so all three requests share a keep-alive connection
+session = requests.Session()
+
 # 1. Login
 login_data = {
     "username": "admin",
     "password": "admin"
 }
-response = requests.post(f"{BASE_URL}/login/access-token", data=login_data)
+response = session.post(f"{BASE_URL}/login/access-token", data=login_data)
 if response.status_code != 200:
     print(f"Login failed: {response.text}")
     exit(1)
 
 token = response.json()["access_token"]
-headers = {"Authorization": f"Bearer {token}"}
+session.headers["Authorization"] = f"Bearer {token}"
 print("Login successful")
 
 # 2. Get File ID
-response = requests.get(f"{BASE_URL}/files?limit=1", headers=headers)
+response = session.get(f"{BASE_URL}/files?limit=1")
 if response.status_code != 200:
     print(f"Get files failed: {response.text}")
     exit(1)
@@ -40,7 +43,7 @@ update_data = {
 }
 
 print(f"Sending PATCH request with data: {json.dumps(update_data, indent=2)}")
-response = requests.patch(f"{BASE_URL}/files/{file_id}", json=update_data, headers=headers)
+response = session.patch(f"{BASE_URL}/files/{file_id}", json=update_data)
 
 if response.status_code == 200:
     print("Update successful!")
@@ -22,17 +22,19 @@ from app.models.sensor_file import PhysicalFile, SensorFile
 TEST_DATA_DIR = Path(r"c:\Users\acang\Desktop\SensorHub\test_data")
 TEMP_DIR = TEST_DATA_DIR # Use existing test_data dir
 
-def create_dummy_zst(filename="test_rebuild.raw.zst", content=b"Hello World" * 100):
-    """Create a simple zstd file."""
+def create_dummy_zst(filename="test_rebuild.raw.zst", content=b"Hello World" * 100, chunk_size=1024 * 1024):
+    """Create a simple zstd file, streamed to disk chunk by chunk."""
     cctx = zstd.ZstdCompressor()
-    compressed = cctx.compress(content)
-    
-    md5 = hashlib.md5(content).hexdigest()
+    md5 = hashlib.md5()
     path = TEMP_DIR / filename
     with open(path, "wb") as f:
-        f.write(compressed)
+        with cctx.stream_writer(f) as writer:
+            for i in range(0, len(content), chunk_size):
+                chunk = content[i:i + chunk_size]
+                writer.write(chunk)
+                md5.update(chunk)
     
-    return path, md5, len(content)
+    return path, md5.hexdigest(), len(content)
 
 def test_rebuild_logic():
     print("=== Testing Rebuild Logic ===")
@@ -60,5 +62,46 @@ def test_rebuild_logic():
         
     print("\n=== All Tests Passed ===")
 
+def test_verify_only_rejects_unindexed_data():
+    print("=== Testing Verify-Only Path Against Unindexed Data ===")
+    cctx = zstd.ZstdCompressor()
+    content = b"Hello World\n" * 100
+    extra = b"Unindexed\n" * 100
+    expected_md5 = hashlib.md5(content).hexdigest()
+    
+    # 1. Trailing frame not listed in the index (compressedSize still matches the file)
+    path, _, _ = create_dummy_zst("test_trailing.raw.zst", content)
+    index = StorageService.verify_and_rebuild_index(path, expected_md5)["frame_index"]
+    with open(path, "ab") as f:
+        f.write(cctx.compress(extra))
+    index["compressedSize"] = path.stat().st_size
+    
+    result = StorageService.verify_and_rebuild_index(path, expected_md5, index)
+    print(f"Trailing frame: valid={result['valid']} rebuilt={result['rebuilt']}")
+    assert result["valid"] == False
+    print("✅ Test 2 Passed: Trailing unindexed frame is rejected.")
+    os.remove(path)
+    
+    # 2. Two zstd frames inside a single indexed frame (cl)
+    path = TEMP_DIR / "test_two_frames.raw.zst"
+    blob = cctx.compress(content) + cctx.compress(extra)
+    path.write_bytes(blob)
+    index = {
+        "version": 2,
+        "frameSize": 2 * 1024 * 1024,
+        "maxFrameSize": 4 * 1024 * 1024,
+        "lineAligned": True,
+        "originalSize": len(content),
+        "compressedSize": len(blob),
+        "frames": [{"cs": 0, "cl": len(blob), "ds": 0, "dl": len(content), "nl": True}],
+    }
+    
+    result = StorageService.verify_and_rebuild_index(path, expected_md5, index)
+    print(f"Two frames in one cl: valid={result['valid']} rebuilt={result['rebuilt']}")
+    assert result["valid"] == False
+    print("✅ Test 3 Passed: Extra frame inside one index entry is rejected.")
+    os.remove(path)
+
 if __name__ == "__main__":
     test_rebuild_logic()
+    test_verify_only_rejects_unindexed_data()